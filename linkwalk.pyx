@@ -0,0 +1,53 @@
+# cython: language_level=3
+"""
+Copyright (c) 2020 Sam Hume
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Compiled version of LinkCrawler._link_finder used by prime_cache.py when built with: cythonize -i linkwalk.pyx
+"""
+from cpython.dict cimport PyDict_Check
+from cpython.list cimport PyList_Check
+from cpython.unicode cimport PyUnicode_Check
+
+
+cpdef list find_hrefs(object json_input, str lookup_key="href"):
+    """
+    walks JSON formatted API content level by level with an explicit queue to find a key ("href") so that sibling links
+    are found in document order
+    :param json_input: CDISC Library API content decoded from JSON
+    :param lookup_key: url (link) identifier to find in the json_input - this is "href" in the CDISC Library
+    :return: list of the urls (links) found
+    """
+    cdef list hrefs = []
+    # the queue is consumed by index rather than popped from the front, which would move every remaining item
+    cdef list queue = [json_input]
+    cdef Py_ssize_t i = 0
+    cdef object node, k, v
+    while i < len(queue):
+        node = queue[i]
+        i += 1
+        if PyDict_Check(node):
+            for k, v in (<dict>node).items():
+                if k == lookup_key:
+                    if PyUnicode_Check(v):
+                        hrefs.append(v)
+                elif PyDict_Check(v) or PyList_Check(v):
+                    queue.append(v)
+        elif PyList_Check(node):
+            for v in <list>node:
+                if PyDict_Check(v) or PyList_Check(v):
+                    queue.append(v)
+    return hrefs
@@ -15,16 +15,51 @@ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY
 TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
-import requests
+import asyncio
+import httpx
+import ijson
+import io
 import os
-import json
+import time
 import logging
+from logging.handlers import MemoryHandler
+import orjson
 import argparse
-import datetime
-import xmltodict
+import ast
+import hashlib
+from collections import deque
+from lxml import etree
+try:
+    # optional compiled version of LinkCrawler._link_finder - build it with: cythonize -i linkwalk.pyx
+    from linkwalk import find_hrefs
+except ImportError:
+    find_hrefs = None
 
 # name of the file to capture the visited urls to prevent multiple visits
 TESTED_URLS_FILE = "tested_urls.txt"
+# directory that caches the hrefs found in each response body by its digest so that an unchanged (304) response does
+# not need to be downloaded and a body seen before does not need to be parsed again
+HREFS_CACHE_DIR = "hrefs_cache"
+# number of urls appended to the TESTED_URLS_FILE between flushes to disk
+TESTED_URLS_FLUSH_COUNT = 100
+# variable in the filter file templates that is replaced with the url being tested
+TEMPLATE_VARIABLE = "$_url"
+# syntax allowed in the filter expressions that are not simple url equals, startswith, or substring tests
+SAFE_FILTER_NODES = (ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.Compare, ast.Eq, ast.NotEq, ast.In,
+                     ast.NotIn, ast.Tuple, ast.Load)
+SAFE_URL_METHODS = ("startswith", "endswith")
+# JSON content at least this many bytes is streamed with ijson rather than decoded in one pass with orjson
+JSON_STREAM_SIZE = 8 * 1024 * 1024
+# qualified name of the XLink href attribute used for links in XML content
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+# media type suffixes of the responses that links are found in - other response bodies are not kept or parsed
+LINK_MEDIA_TYPE_SUFFIXES = ("/json", "+json", "/xml", "+xml")
+# response statuses that are retried, waiting RETRY_BACKOFF seconds doubled on each attempt or as long as Retry-After
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_COUNT = 3
+RETRY_BACKOFF = 0.3
+# default number of crawl workers and so the maximum number of requests in flight against the CDISC Library at once
+CONCURRENT_REQUESTS = 16
 
 class LinkCrawler:
     """
@@ -41,48 +76,208 @@ class LinkCrawler:
         self.headers = {"Accept": args.media_type, "User-Agent": "crawler", "api-key": args.api_key}
         self.verbose = args.verbose
         self.log_path = args.log_path
+        self.revalidate = args.revalidate
+        self.concurrency = args.concurrency
         log_file_name = os.path.join(args.log_path, args.log_file)
         self.logger = self._setup_logging(log_file_name)
         self.tested_urls = set()
+        self._tested_records = {}       # ETag and Last-Modified validators by url from the TESTED_URLS_FILE
+        self._hrefs_cache_path = os.path.join(args.log_path, HREFS_CACHE_DIR)
+        os.makedirs(self._hrefs_cache_path, exist_ok=True)
         self._load_tested_urls()        # load previously visited urls - clear this file if starting fresh
-        self.urls = set()
-        self.urls.add(self.resource)
-        self.template_variables = ["$_url"]
+        self._tested_urls_file = self._open_tested_urls()
+        self._unflushed_count = 0
+        self.seen_urls = {self.resource}    # urls queued on the frontier during this run
         self.filters = self._load_filters(args.filter, args.log_path)
+        (self._equals_filters, self._prefix_filters,
+         self._contains_filters, self._expression_filters) = self._compile_filters(self.filters)
+        self._filter_cache = {}         # filter results by url since the same href appears in many documents
 
-    def cache_api_resources(self):
+    async def cache_api_resources(self):
         """
         initiated with the starting url (API resource) and crawls all previously unseen hrefs found that pass the filters
         """
-        while self.urls:
-            resource = self.urls.pop()
-            request_time = datetime.datetime.now()
-            self.logger.info(f"Requested: {request_time.strftime('%m/%d/%Y, %H:%M:%S')} - {resource}")
-            r = requests.get(self.base_url + resource, headers=self.headers)
-            self.tested_urls.add(resource)
-            if r.status_code == 200:
-                self.logger.info(f"Received: {str(datetime.datetime.now() - request_time).split('.')[0]} - {resource}")
-                self._get_links(r.text)
-            else:
-                self.logger.error(f"Error: {str(r.status_code)} for {resource}")
-        self._save_tested_urls()
+        # HTTP/2 multiplexes the concurrent requests as streams over the connection to the CDISC Library
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        # the transport retries failed connections - retrying error statuses is handled in _fetch
+        transport = httpx.AsyncHTTPTransport(http2=True, limits=limits, retries=RETRY_COUNT)
+        frontier = asyncio.Queue()
+        frontier.put_nowait(self.resource)
+        try:
+            async with httpx.AsyncClient(transport=transport, headers=self.headers, timeout=30.0,
+                                         follow_redirects=True) as client:
+                workers = [asyncio.create_task(self._crawl_worker(client, frontier)) for _ in range(self.concurrency)]
+                crawled = asyncio.create_task(frontier.join())
+                done, _ = await asyncio.wait([crawled, *workers], return_when=asyncio.FIRST_COMPLETED)
+                for task in [crawled, *workers]:
+                    task.cancel()
+                # wait for the cancelled workers to stop before the client is closed under any request in flight
+                await asyncio.gather(crawled, *workers, return_exceptions=True)
+                # workers only finish early by raising so surface that error instead of waiting on the queue forever
+                for task in done:
+                    task.result()
+        finally:
+            self._tested_urls_file.close()
 
-    def _get_links(self, content):
+    async def _crawl_worker(self, client, frontier):
         """
-        adds href urls found in CDISC Library content into url list to retrieve if passed filter and not already retrieved
-        :param content: metadata retrieved from the CDISC Library API
+        takes urls from the frontier queue, retrieves them, and puts the new links found back on the queue
+        :param client: httpx async client shared by all requests in the crawl
+        :param frontier: queue of the urls waiting to be retrieved
         """
-        content_dict = self._create_dict_from_content(content)
-        for url in self._link_finder(content_dict, "href"):
-            if self._passes_primer_filter(url):
-                self.urls.add(url)
-                # certain HATEOAS was removed from the CT API responses to improve performance
-                if "/ct/" in url and "codelist" not in url and url != "/mdr/ct/packages":
-                    self.urls.add(url + "/codelists")
-            else:
-                if self.verbose:
-                    self.logger.info(f"Skipping: {url}")
-        self.urls.difference_update(self.tested_urls)
+        while True:
+            resource = await frontier.get()
+            try:
+                if resource in self.tested_urls and resource != self.resource:
+                    # retrieved on a previous run so the links come from the cache without requesting it again
+                    for url in self._get_links(self._load_hrefs(self._tested_records[resource]["digest"])):
+                        frontier.put_nowait(url)
+                    continue
+                self.tested_urls.add(resource)
+                status, headers, content = await self._fetch(client, resource)
+                if status == 200 and content is None:
+                    hrefs = []
+                    self._save_tested_url(resource, headers, None)
+                elif status == 200:
+                    digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+                    hrefs = self._find_hrefs(content, digest)
+                    self._save_tested_url(resource, headers, digest)
+                elif status == 304:
+                    # unchanged since the last run so the links come from the cache instead of the response body
+                    digest = self._tested_records[resource]["digest"]
+                    hrefs = self._load_hrefs(digest) if digest else []
+                else:
+                    self.logger.error("Error: %s for %s", status, resource)
+                    continue
+                for url in self._get_links(hrefs):
+                    frontier.put_nowait(url)
+            except httpx.HTTPError as exc:
+                self.logger.error("Error: %r for %s", exc, resource)
+            finally:
+                frontier.task_done()
+
+    async def _fetch(self, client, resource):
+        """
+        GET a single API resource from the CDISC Library, conditional on the validators saved by a previous run. The body
+        is streamed and only kept if its media type can contain links. Throttled (429) and server error responses are
+        retried with backoff.
+        :param client: httpx async client shared by all requests in the crawl
+        :param resource: the API resource (URL relative to the base url) to retrieve
+        :return: tuple with the HTTP status code, the response headers, and the raw response body bytes (or None)
+        """
+        request_time = time.monotonic()
+        self.logger.info("Requested: %s", resource)
+        headers = self._conditional_headers(resource)
+        for attempt in range(RETRY_COUNT + 1):
+            async with client.stream("GET", self.base_url + resource, headers=headers) as r:
+                if r.status_code in RETRY_STATUSES and attempt < RETRY_COUNT:
+                    delay = self._retry_delay(r.headers.get("Retry-After"), attempt)
+                else:
+                    # without a Content-Type the response is taken to be in the media type that was requested
+                    content_type = r.headers.get("Content-Type") or self.headers["Accept"]
+                    if r.status_code == 200 and self._has_links(content_type):
+                        content = await r.aread()
+                    else:
+                        # the body is still read to the end so the response completes and is cached, but is not kept
+                        async for _ in r.aiter_raw():
+                            pass
+                        content = None
+                    break
+            self.logger.info("Retrying: %.1fs after %s - %s", delay, r.status_code, resource)
+            await asyncio.sleep(delay)
+        if r.status_code == 200:
+            self.logger.info("Received: %.2fs - %s", time.monotonic() - request_time, resource)
+        elif r.status_code == 304:
+            self.logger.info("Not Modified: %.2fs - %s", time.monotonic() - request_time, resource)
+        return r.status_code, r.headers, content
+
+    @staticmethod
+    def _retry_delay(retry_after, attempt):
+        """
+        determine how long to wait before retrying a request, using the Retry-After header if the server sent one
+        :param retry_after: the Retry-After header of the response in seconds, or None if it was not sent
+        :param attempt: number of the attempt that failed, starting from 0
+        :return: number of seconds to wait before the next attempt
+        """
+        try:
+            return max(float(retry_after), 0.0)
+        except (TypeError, ValueError):
+            # no header or an HTTP date rather than seconds
+            return RETRY_BACKOFF * (2 ** attempt)
+
+    @staticmethod
+    def _has_links(content_type):
+        """
+        determine if a response media type is one that hrefs are found in (JSON or XML)
+        :param content_type: the Content-Type header of the response, or the requested media type if it has none
+        :return: boolean that indicates whether or not the response body should be parsed for links
+        """
+        return content_type.split(";")[0].strip().lower().endswith(LINK_MEDIA_TYPE_SUFFIXES)
+
+    def _conditional_headers(self, resource):
+        """
+        create the If-None-Match and If-Modified-Since headers from the validators saved when the url was last retrieved
+        :param resource: the API resource (URL relative to the base url) to retrieve
+        :return: dictionary of the conditional request headers - empty if the url has no validators or cached hrefs
+        """
+        record = self._tested_records.get(resource)
+        headers = {}
+        # a 304 response is only useful if the hrefs from the previous response are still in the cache (a digest of
+        # None means the previous response had no links to cache)
+        if (record and "digest" in record
+                and (record["digest"] is None or os.path.exists(self._hrefs_file_name(record["digest"])))):
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def _get_links(self, hrefs):
+        """
+        finds the href urls in CDISC Library content to retrieve if passed filter and not already seen or retrieved. Urls
+        retrieved on a previous run are included if their hrefs are cached so the crawl can reach the urls below them.
+        :param hrefs: the href urls found in metadata retrieved from the CDISC Library API
+        :return: list of the new urls to queue in the order they were found so that related urls are queued together
+        """
+        candidates = set(hrefs)
+        candidates -= self.seen_urls
+        passing = {url for url in candidates if self._passes_primer_filter(url)}
+        if self.verbose:
+            for url in candidates - passing:
+                self.logger.info("Skipping: %s", url)
+        ct_extra = {codelists for codelists in map(self._synthesize_ct_codelists, passing) if codelists}
+        # passing already excludes seen urls so only the synthesized ones need the set difference
+        ct_extra -= self.seen_urls
+        queued = passing | ct_extra
+        # every url tested during this run has been seen so these were tested on a previous run
+        queued -= {url for url in queued & self.tested_urls if not self._has_cached_hrefs(url)}
+        self.seen_urls |= passing
+        self.seen_urls |= ct_extra
+        ordered = [url for url in dict.fromkeys(hrefs) if url in passing]
+        ordered += [url for url in map(self._synthesize_ct_codelists, ordered) if url]
+        new_urls = [url for url in dict.fromkeys(ordered) if url in queued]
+        return new_urls
+
+    def _has_cached_hrefs(self, url):
+        """
+        determine if the hrefs found in a url retrieved on a previous run are in the cache
+        :param url: the url retrieved on a previous run
+        :return: boolean that indicates whether or not the url can be crawled from the cache
+        """
+        record = self._tested_records.get(url)
+        return bool(record and record.get("digest") and os.path.exists(self._hrefs_file_name(record["digest"])))
+
+    @staticmethod
+    def _synthesize_ct_codelists(url):
+        """
+        certain HATEOAS was removed from the CT API responses to improve performance so the codelists url for a CT
+        package is created from the package url
+        :param url: the URL that passed the filter
+        :return: the codelists url for the CT package url or None if url is not a CT package
+        """
+        if url.startswith("/mdr/ct/") and url != "/mdr/ct/packages" and "codelist" not in url:
+            return url + "/codelists"
+        return None
 
     def _passes_primer_filter(self, url):
         """
@@ -90,60 +285,75 @@ class LinkCrawler:
         :param url: the URL to test
         :return: boolean that indicates whether or not to GET the content from the CDISC Library using the URL
         """
-        is_pass_filter = False
-        replacements = [url]
-        for filter in self.filters:
-            final_filter = self._process_string(filter, replacements)
-            is_pass_filter = eval(final_filter)
-            if is_pass_filter:
-                break
+        is_pass_filter = self._filter_cache.get(url)
+        if is_pass_filter is None:
+            is_pass_filter = (url in self._equals_filters or url.startswith(self._prefix_filters)
+                              or any(part in url for part in self._contains_filters)
+                              or any(passes(url) for passes in self._expression_filters))
+            self._filter_cache[url] = is_pass_filter
         return is_pass_filter
 
-    def _process_string(self, item, replacements):
+    def _href_finder(self, content):
         """
-        replace variables in template filter strings (e.g. replace $_url with the current url)
-        :param item: the template filter string with the variables
-        :param replacements: values that replace the variables
-        :return: the updated string with all variables replaced with values
-        """
-        updated_item = item
-        for variable, replacement in zip(self.template_variables, replacements):
-            # assumes that we're always replacing the template variable with a literal string
-            updated_item = updated_item.replace(variable, "\"" + replacement + "\"")
-        return updated_item
-
-    def _create_dict_from_content(self, content):
-        """
-        content is retrieved from the CDISC Library in different media types but we use JSON to find urls
-        :param content: metadata retrieved from the CDISC Library using different media types
-        :return: dictionary containing CDISC Library content (and converted from original format)
+        generator that finds the hrefs in content retrieved from the CDISC Library in any of the media types
+        :param content: metadata retrieved from the CDISC Library using different media types as raw bytes
+        :return: yields a url (a link)
         """
-        if "json" in self.headers["Accept"]:
-            content_dict = json.loads(content)
+        if "json" in self.headers["Accept"] and len(content) < JSON_STREAM_SIZE:
+            # orjson decodes directly from the bytes and is faster than generating parse events for typical responses
+            json_input = orjson.loads(content)
+            if find_hrefs is not None:
+                yield from find_hrefs(json_input, "href")
+            else:
+                yield from self._link_finder(json_input, "href")
+        elif "json" in self.headers["Accept"]:
+            # stream the parse events so the hrefs in large packages are found without building the whole document
+            for prefix, event, value in ijson.parse(io.BytesIO(content)):
+                if event == "string" and (prefix == "href" or prefix.endswith(".href")):
+                    yield value
         elif "xml" in self.headers["Accept"]:
-            content_dict = xmltodict.parse(content)
+            # entities and network access are disabled as the content is only scanned for links
+            for _, elem in etree.iterparse(io.BytesIO(content), events=("end",), resolve_entities=False, no_network=True):
+                if elem.tag.rpartition("}")[2] == "href" and elem.text:
+                    yield elem.text.strip()
+                else:
+                    href = elem.get("href") or elem.get(XLINK_HREF)
+                    if href:
+                        yield href
+                # clearing each element once it has been scanned and removing the scanned siblings before it from the
+                # parent keeps memory flat for large documents
+                elem.clear()
+                # the root has no parent but can follow a comment or processing instruction that is not removed
+                parent = elem.getparent()
+                if parent is not None:
+                    while elem.getprevious() is not None:
+                        del parent[0]
         elif "vnd.ms-excel" in self.headers["Accept"] or "text/csv" in self.headers["Accept"]:
-            content_dict = {}
+            return
         else:
             raise ValueError("Unknown media type: " + self.headers["Accept"])
-        return content_dict
 
     def _link_finder(self, json_input, lookup_key):
         """
-        generator that creates a lazy recursion to find a key ("href") in JSON formatted API content
-        :param json_input: CDISC Library API content formatted as JSON (other media types converted to JSON)
+        generator that walks JSON formatted API content level by level with an explicit queue to find a key ("href") so
+        that sibling links are found in document order
+        :param json_input: CDISC Library API content decoded from JSON
         :param lookup_key: url (link) identifier to find in the json_input - this is "href" in the CDISC Library
         :return: yields a url (a link)
         """
-        if isinstance(json_input, dict):
-             for k, v in json_input.items():
-                if k == lookup_key:
-                    yield v
-                else:
-                    yield from self._link_finder(v, lookup_key)
-        elif isinstance(json_input, list):
-            for item in json_input:
-                yield from self._link_finder(item, lookup_key)
+        queue = deque([json_input])
+        while queue:
+            node = queue.popleft()
+            if isinstance(node, dict):
+                for k, v in node.items():
+                    if k == lookup_key:
+                        if isinstance(v, str):
+                            yield v
+                    elif isinstance(v, (dict, list)):
+                        # only containers are pushed so the walk never visits the primitive leaves
+                        queue.append(v)
+            elif isinstance(node, list):
+                queue.extend(item for item in node if isinstance(item, (dict, list)))
 
     def _setup_logging(self, log_file_name):
         """
@@ -153,10 +363,18 @@ class LinkCrawler:
         """
         logger = logging.getLogger()
         logger.setLevel(logging.INFO)
-        fileHandler = logging.FileHandler(log_file_name)
-        logger.addHandler(fileHandler)
+        # the handlers timestamp each message so the messages themselves are only formatted if they are logged
+        formatter = logging.Formatter("%(asctime)s - %(message)s", datefmt="%m/%d/%Y, %H:%M:%S")
+        fileHandler = logging.FileHandler(log_file_name, delay=True)
+        fileHandler.setFormatter(formatter)
+        # buffer the file writes into batches - errors are written immediately and logging flushes the rest at exit
+        memoryHandler = MemoryHandler(capacity=1024, flushLevel=logging.ERROR, target=fileHandler)
+        logger.addHandler(memoryHandler)
         consoleHandler = logging.StreamHandler()
+        consoleHandler.setFormatter(formatter)
         logger.addHandler(consoleHandler)
+        # httpx logs every request at INFO, which would duplicate the Requested and Received messages
+        logging.getLogger("httpx").setLevel(logging.WARNING)
         return logger
 
     @staticmethod
@@ -169,30 +387,186 @@ class LinkCrawler:
         """
         filter_file_name = os.path.join(log_path, filename)
         with open(filter_file_name, "r", encoding="utf-8") as filter:
-            filters = filter.read().splitlines()
+            filters = [line for line in filter.read().splitlines() if line.strip()]
         return filters
 
+    @staticmethod
+    def _compile_filters(filters):
+        """
+        sort the filters into exact matches, prefixes, and substrings that are tested without evaluating any code, and
+        compile the remaining boolean expressions once into functions of the url
+        :param filters: list of templated filter strings (e.g. "sdtm/1-8" in $_url)
+        :return: tuple of the set of urls, tuple of prefixes, tuple of substrings, and list of compiled expressions
+        """
+        equals, prefixes, contains, expressions = set(), [], [], []
+        for line in filters:
+            source = line.replace(TEMPLATE_VARIABLE, "url").strip()
+            expression = ast.parse(source, mode="eval").body
+            kind, value = LinkCrawler._classify_filter(expression)
+            if kind == "equals":
+                equals.add(value)
+            elif kind == "startswith":
+                prefixes.append(value)
+            elif kind == "contains":
+                contains.append(value)
+            else:
+                LinkCrawler._check_filter_expression(expression, line)
+                expressions.append(eval(compile("lambda url: " + source, "<filter>", "eval")))
+        return equals, tuple(prefixes), tuple(contains), expressions
+
+    @staticmethod
+    def _classify_filter(expression):
+        """
+        identify the simple filter forms: url == "...", "..." in url, and url.startswith("...")
+        :param expression: the parsed filter expression with the template variable replaced by url
+        :return: tuple of the kind of filter (equals, startswith, contains, or None) and the string to match
+        """
+        def is_url(node):
+            return isinstance(node, ast.Name) and node.id == "url"
+
+        def is_str(node):
+            return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+        if isinstance(expression, ast.Compare) and len(expression.ops) == 1:
+            left, op, right = expression.left, expression.ops[0], expression.comparators[0]
+            if isinstance(op, ast.Eq) and is_url(left) and is_str(right):
+                return "equals", right.value
+            if isinstance(op, ast.Eq) and is_str(left) and is_url(right):
+                return "equals", left.value
+            if isinstance(op, ast.In) and is_str(left) and is_url(right):
+                return "contains", left.value
+        elif (isinstance(expression, ast.Call) and isinstance(expression.func, ast.Attribute)
+              and is_url(expression.func.value) and expression.func.attr == "startswith"
+              and len(expression.args) == 1 and not expression.keywords and is_str(expression.args[0])):
+            return "startswith", expression.args[0].value
+        return None, None
+
+    @staticmethod
+    def _check_filter_expression(expression, line):
+        """
+        only allow boolean combinations of string tests on the url so that the filter file cannot run arbitrary code
+        :param expression: the parsed filter expression with the template variable replaced by url
+        :param line: the filter as written in the filter file, used in the error message
+        """
+        for node in ast.walk(expression):
+            if isinstance(node, ast.Constant):
+                allowed = isinstance(node.value, str)
+            elif isinstance(node, ast.Name):
+                allowed = node.id == "url"
+            elif isinstance(node, ast.Call):
+                allowed = (isinstance(node.func, ast.Attribute) and node.func.attr in SAFE_URL_METHODS
+                           and not node.keywords)
+            elif isinstance(node, ast.Attribute):
+                allowed = isinstance(node.value, ast.Name) and node.attr in SAFE_URL_METHODS
+            else:
+                allowed = isinstance(node, SAFE_FILTER_NODES)
+            if not allowed:
+                raise ValueError("Unsupported filter: " + line)
+
     def _load_tested_urls(self):
         """
-        load the already visited urls (links) from a text file to skip re-loading them.
+        load the already visited urls (links) and their validators from a text file to skip re-loading them. Each line
+        is a JSON record or, for files written by older versions, just the url. With revalidate the urls are not
+        skipped and are instead requested again conditional on their validators.
         """
         tested_urls_file_name = os.path.join(self.log_path, TESTED_URLS_FILE)
         try:
             with open(tested_urls_file_name, "r", encoding="utf-8") as urls:
-                self.tested_urls = set(urls.read().splitlines())
-            self.logger.info(f"Loaded {len(self.tested_urls)} previously tested URLs from {TESTED_URLS_FILE}")
-        except:
-            self.logger.info(f"No previously tested URLs loaded from {TESTED_URLS_FILE}.")
+                lines = urls.read().splitlines()
+        except FileNotFoundError:
+            self.logger.info("No previously tested URLs loaded from %s.", TESTED_URLS_FILE)
+            return
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line) if line.startswith("{") else {"url": line}
+                self._tested_records[record["url"]] = record
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                # e.g. the last line cut off when a previous run was killed while writing
+                self.logger.error("Skipping unreadable line in %s: %s", TESTED_URLS_FILE, line)
+        if not self.revalidate:
+            self.tested_urls = set(self._tested_records)
+        self.logger.info("Loaded %d previously tested URLs from %s", len(self._tested_records), TESTED_URLS_FILE)
 
-    def _save_tested_urls(self):
+    def _open_tested_urls(self):
         """
-        write the urls (links) that have been visited to a file so that they are not re-visited
+        rewrite the visited urls (links) file with one record per url from those loaded, so that it does not grow with
+        the records appended for the same urls on each run, then open it for appending so that progress is kept even
+        if the crawl does not finish
+        :return: file object opened in append mode with a large buffer to batch the writes
         """
-        # TODO add feature to include media type with url as the same url is loaded for multiple media types
         tested_urls_file_name = os.path.join(self.log_path, TESTED_URLS_FILE)
-        with open(tested_urls_file_name, "w", encoding="utf-8") as urls:
-            for url in self.tested_urls:
-                urls.write(url + "\n")
+        if self._tested_records:
+            # written to a temporary file first so the records are not lost if the rewrite is interrupted
+            with open(tested_urls_file_name + ".tmp", "w", encoding="utf-8") as urls:
+                for record in self._tested_records.values():
+                    urls.write(orjson.dumps(record).decode("utf-8") + "\n")
+            os.replace(tested_urls_file_name + ".tmp", tested_urls_file_name)
+        return open(tested_urls_file_name, "a", buffering=1 << 20, encoding="utf-8")
+
+    def _save_tested_url(self, url, headers, digest):
+        """
+        append a url (link) that has been visited to the file with its validators so that it is not re-visited
+        :param url: the url successfully retrieved from the CDISC Library
+        :param headers: the response headers that include the ETag and Last-Modified validators
+        :param digest: digest of the response body that identifies its hrefs in the cache - None if it has no links
+        """
+        # TODO add feature to include media type with url as the same url is loaded for multiple media types
+        record = {"url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                  "digest": digest}
+        self._tested_records[url] = record
+        self._tested_urls_file.write(orjson.dumps(record).decode("utf-8") + "\n")
+        self._unflushed_count += 1
+        if self._unflushed_count >= TESTED_URLS_FLUSH_COUNT:
+            self._tested_urls_file.flush()
+            self._unflushed_count = 0
+
+    def _hrefs_file_name(self, digest):
+        """
+        :param digest: digest of the response body the hrefs were found in
+        :return: name of the file in the hrefs cache that holds the hrefs found in the response body
+        """
+        return os.path.join(self._hrefs_cache_path, digest + ".links")
+
+    def _find_hrefs(self, content, digest):
+        """
+        find the hrefs in a response body, re-using the cached hrefs if the same body has been parsed before
+        :param content: metadata retrieved from the CDISC Library API as raw bytes
+        :param digest: digest of the response body that identifies its hrefs in the cache
+        :return: list of href urls found in the content
+        """
+        try:
+            return self._load_hrefs(digest)
+        except FileNotFoundError:
+            hrefs = list(self._href_finder(content))
+            hrefs_file_name = self._hrefs_file_name(digest)
+            # written to a temporary file first so an interrupted write never leaves a truncated list in the cache
+            with open(hrefs_file_name + ".tmp", "w", encoding="utf-8") as hrefs_file:
+                hrefs_file.write("\n".join(hrefs))
+            os.replace(hrefs_file_name + ".tmp", hrefs_file_name)
+            return hrefs
+
+    def _load_hrefs(self, digest):
+        """
+        load the hrefs found in a response body on a previous run
+        :param digest: digest of the response body the hrefs were found in
+        :return: list of href urls found in the content previously retrieved
+        """
+        with open(self._hrefs_file_name(digest), "r", encoding="utf-8") as hrefs_file:
+            return hrefs_file.read().splitlines()
+
+
+def positive_int(value):
+    """
+    argparse type for options that need at least one, e.g. the crawl stops making progress with no workers
+    :param value: the command-line argument value
+    :return: the value as an integer
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
 
 
 def set_cmd_line_args():
@@ -213,6 +587,10 @@ def set_cmd_line_args():
     parser.add_argument("-m", "--media_type", help="media_type", default="application/json", dest="media_type")
     parser.add_argument("-v", "--verbose", dest="verbose", help="verbose", default=False, required=False)
     parser.add_argument("-f", "--filter", help="filter file name", default="prime_cache_filters.txt", dest="filter")
+    parser.add_argument("-u", "--revalidate", dest="revalidate", help="re-request tested URLs if modified",
+                        action="store_true")
+    parser.add_argument("-c", "--concurrency", dest="concurrency", help="number of concurrent requests", type=positive_int,
+                        default=CONCURRENT_REQUESTS)
     args = parser.parse_args()
     return args
 
@@ -223,7 +601,7 @@ def main():
     """
     args = set_cmd_line_args()
     ln = LinkCrawler(args)
-    ln.cache_api_resources()
+    asyncio.run(ln.cache_api_resources())
 
 
 if __name__ == "__main__":